@@ -1,36 +1,141 @@
-import os, json, time, argparse
-from openai import OpenAI
+import os, re, json, time, argparse, asyncio, hashlib, sqlite3, mmap, itertools, functools, queue, random
+import email.utils
+from concurrent.futures import ThreadPoolExecutor
+import openai
+from openai import AsyncOpenAI
 
-def load_jsonl(path):
-    with open(path, "r") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                yield json.loads(line)
+from models.utils import AsyncRateLimiter, get_first_value, iter_jsonl_lines, json_dumps, json_loads, load_dataset_rows
+
+def merge_verdict(line, fields):
+    # Splice new fields in before the row's closing brace instead of re-encoding the (large) row
+    body = line.rstrip()
+    end = body.rfind(b"}")
+    sep = b"" if body[:end].rstrip().endswith(b"{") else b","
+    return body[:end] + sep + json_dumps(fields)[1:-1] + b"}\n"
+
+def encode_judged_row(line, row, fields):
+    # Re-judging an already judged file: overwrite the old fields rather than duplicate keys
+    if any(key in row for key in fields):
+        return json_dumps({**row, **fields}) + b"\n"
+    return merge_verdict(line, fields)
+
+OUTPUT_BUFFER_SIZE = 1 << 20
+QUEUE_SIZE = 1024
+READ_BATCH_SIZE = 256
+
+# Serializes and writes rows on a background thread so encoding overlaps with judging
+class JsonlWriter:
+    def __init__(self, path, append=False):
+        # A fresh output goes to a temp file that replaces path only once the run succeeds, so
+        # --generations_out may name --generations_in (re-judging in place) without truncating it first
+        self.path = path
+        self.tmp_path = None if append else f"{path}.{os.getpid()}.tmp"
+        # Opened here so a bad path fails before any judging starts
+        self.file = open(path if append else self.tmp_path, "ab" if append else "wb", buffering=OUTPUT_BUFFER_SIZE)
+        # Bounded so a stalled disk applies backpressure instead of buffering the whole run in memory
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = self.executor.submit(self._run)
+
+    def _run(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                self.file.write(encode_judged_row(*item))
+        finally:
+            self.file.close()
+
+    def _check(self):
+        # Surface a dead writer thread (e.g. ENOSPC) on the next write rather than after the whole run
+        if self.future.done():
+            self.future.result()
+            raise RuntimeError("JSONL writer thread stopped unexpectedly")
+
+    def _put(self, item):
+        while True:
+            self._check()
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    async def write(self, line, row, fields):
+        item = (line, row, fields)
+        self._check()
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            # Wait for room on a helper thread: only this worker is held back, not in-flight requests
+            await asyncio.to_thread(self._put, item)
+
+    def close(self, commit=True):
+        try:
+            if not self.future.done():
+                self._put(None)
+            self.future.result()
+            if commit and self.tmp_path is not None:
+                os.replace(self.tmp_path, self.path)
+        finally:
+            self.executor.shutdown()
+            if self.tmp_path is not None and os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+_ID_KEYS = ("id", "example_id", "exampleId")
+
+def get_row_id(row):
+    return get_first_value(row, _ID_KEYS)
+
+def build_dataset_index(path):
+    return {ex_id: ex for ex in load_dataset_rows(path) if (ex_id := get_row_id(ex))}
 
-def save_jsonl(path, rows):
-    with open(path, "w") as f:
-        for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+# An id/example_id/exampleId key on a raw JSONL line, nested objects included. Group 1 is the value
+# when it is a plain non-empty string (no escapes); otherwise it is None and the row needs a real parse.
+_ID_RX = re.compile(rb'"(?:id|example_id|exampleId)"\s*:\s*(?:"([^"\\]+)")?')
+
+def scan_row_id(line):
+    # Fast path for the common row carrying exactly one id key. With several (e.g. both "id" and
+    # "example_id", or a nested "id") only a real parse can apply get_row_id's top-level precedence,
+    # so those rows, like non-string ids, return None and are parsed by the caller. A row whose only id
+    # key is nested contributes that value, which at worst skips an input row carrying the same id.
+    matches = _ID_RX.findall(line)
+    if len(matches) != 1 or not matches[0]:
+        return None
+    return matches[0].decode()
 
 def load_existing_ids(path):
     ids = set()
-    if not os.path.exists(path):
+    if not os.path.exists(path) or os.stat(path).st_size == 0:
         return ids
-    try:
-        for row in load_jsonl(path):
-            row_id = row.get("id") or row.get("example_id") or row.get("exampleId")
+    with open(path, "rb") as f:
+        for line in f:
+            row_id = scan_row_id(line)
+            if row_id is not None:
+                ids.add(row_id)
+                continue
+            if line.isspace():
+                continue
+            # Non-string, empty or escaped ids need a real parse
+            try:
+                row_id = get_row_id(json_loads(line))
+            except Exception:
+                # If file is partially written/corrupted, best-effort resume
+                continue
             if row_id is not None:
                 ids.add(row_id)
-    except Exception:
-        # If file is partially written/corrupted, best-effort resume
-        pass
     return ids
 
 def count_lines(path):
+    if os.stat(path).st_size == 0:
+        return 0
+    # mmap has no count(), so scan it in large chunks with bytes.count
     count = 0
-    with open(path, "r") as f:
-        for _ in f:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for chunk in iter(lambda: mm.read(1 << 24), b""):
+            count += chunk.count(b"\n")
+        if mm[-1:] != b"\n":
             count += 1
     return count
 
@@ -47,7 +152,9 @@ JUDGE_SYSTEM = (
     "Score 1 if the response satisfies the rubric; otherwise 0. Keep the explanation concise."
 )
 
-def build_user_prompt(example, response_text):
+# The user prompt is a per-example prefix (category, prompt, rubric) followed by the response under
+# judgement, so reruns over the same dataset send an identical leading block that providers can cache
+def build_prompt_prefix(example):
     prompt = example.get("prompt", "")
     rubric = example.get("rubric") or example.get("reference") or ""
     category = example.get("category", "")
@@ -55,34 +162,237 @@ def build_user_prompt(example, response_text):
         f"Category: {category}\n"
         f"Prompt: {prompt}\n\n"
         f"Rubric/Reference (ground truth/requirements): {rubric}\n\n"
+    )
+
+def build_prompt_suffix(response_text):
+    return (
         f"Model response:\n{response_text}\n\n"
         "Decide 0/1 and explain briefly."
     )
 
+def build_user_prompt(example, response_text):
+    return build_prompt_prefix(example) + build_prompt_suffix(response_text)
+
+def get_prompt_cache_key(example):
+    return hashlib.sha256((JUDGE_SYSTEM + build_prompt_prefix(example)).encode()).hexdigest()
+
 def parse_json_reply(text):
     try:
-        return json.loads(text)
-    except Exception:
-        # Try to extract JSON object heuristically
+        return json_loads(text)
+    except ValueError:
+        # Rescue a JSON object wrapped in prose or code fences: parse from the first "{" to the last "}"
         start = text.find("{")
         end = text.rfind("}")
-        if start != -1 and end != -1 and end > start:
+        if start == -1 or end <= start:
+            raise
+        return json_loads(text[start:end+1])
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "image-analysis-eval", "judge.db")
+CACHE_FLUSH_ROWS = 256
+CACHE_FLUSH_INTERVAL = 1.0
+
+# Persistent judge verdicts keyed on sha256(judge model, system prompt, user prompt)
+class LLMCache:
+    def __init__(self, path):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        # WAL lets several judge.py runs share the default cache without readers blocking on a writer
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache(key TEXT PRIMARY KEY, score REAL, explanation TEXT)")
+        self.conn.commit()
+        # New verdicts are buffered and written in one short transaction instead of a commit per row
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def make_key(judge_model, example, response_text):
+        payload = {"m": judge_model, "sys": JUDGE_SYSTEM, "u": build_user_prompt(example, response_text)}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        if key in self.pending:
+            return self.pending[key]
+        return self.conn.execute("SELECT score, explanation FROM cache WHERE key = ?", (key,)).fetchone()
+
+    def set(self, key, score, explanation):
+        self.pending[key] = (score, explanation)
+        if len(self.pending) >= CACHE_FLUSH_ROWS or time.monotonic() - self.last_flush >= CACHE_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        # The batch is dropped even if the write fails: it only saves API calls on a later run
+        rows = [(key, score, explanation) for key, (score, explanation) in self.pending.items()]
+        self.pending = {}
+        self.last_flush = time.monotonic()
+        if rows:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO cache(key, score, explanation) VALUES (?, ?, ?)", rows)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.conn.close()
+
+@functools.lru_cache(maxsize=None)
+def get_token_encoding(judge_model):
+    try:
+        import tiktoken  # type: ignore
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(judge_model)
+    except Exception:
+        # Poe model names are not known to tiktoken; any modern BPE is close enough for budgeting
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception:
+            return None
+
+def estimate_tokens(judge_model, text):
+    encoding = get_token_encoding(judge_model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+def get_retry_after(e):
+    # Seconds the server asked us to wait on a 429, if it said so
+    if not isinstance(e, openai.RateLimitError):
+        return None
+    headers = e.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+    except ValueError:
+        pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    # Retry-After may also be an HTTP-date
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+MAX_BACKOFF = 60.0
+# A server-supplied wait is honoured in full up to this; retrying sooner would only earn another 429
+MAX_RETRY_AFTER = 600.0
+
+def get_retry_delay(e, attempt):
+    # Jitter keeps workers that failed together from all retrying at the same instant
+    retry_after = get_retry_after(e)
+    if retry_after is not None:
+        return min(MAX_RETRY_AFTER, retry_after) + random.random()
+    return min(MAX_BACKOFF, 2 ** attempt) + random.uniform(0, 1)
+
+def is_retryable(e):
+    # Connection errors, timeouts, 408/409/429 and 5xx may pass on another endpoint or a later attempt;
+    # any other 4xx (e.g. a 400 for an over-long response) fails the same way everywhere
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in (408, 409, 429) or e.status_code >= 500
+    return True
+
+POE_BASE_URL = "https://api.poe.com/v1"
+
+# Endpoints that failed this recently are tried only after healthy ones
+ENDPOINT_COOLDOWN = 30.0
+
+class JudgeEndpoint:
+    def __init__(self, base_url, model, concurrency, api_key):
+        # SDK retries are off: failover and judge_with_poe's backoff are the only retry policy
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.base_url = base_url
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.in_flight = 0
+        self.sem = asyncio.Semaphore(self.concurrency)
+        self.last_failure = None
+
+    def is_cooling_down(self, now):
+        return self.last_failure is not None and now - self.last_failure < ENDPOINT_COOLDOWN
+
+# Fans judge calls out over several endpoints, each with its own concurrency limit
+class JudgePool:
+    def __init__(self, endpoints, limiter=None):
+        self.endpoints = endpoints
+        self.limiter = limiter
+        # Verdicts are cached per set of judge models, so one-model pools share the plain model key
+        self.judge_model = "|".join(sorted({ep.model for ep in endpoints}))
+
+    @property
+    def concurrency(self):
+        return sum(ep.concurrency for ep in self.endpoints)
+
+    async def create(self, tokens=0, **kwargs):
+        # Prefer healthy endpoints with the most free slots; on a transient error fail over to the next one
+        now = time.monotonic()
+        order = sorted(self.endpoints, key=lambda ep: (ep.is_cooling_down(now), ep.in_flight - ep.concurrency))
+        last_error = None
+        for ep in order:
+            ep.in_flight += 1
             try:
-                return json.loads(text[start:end+1])
-            except Exception:
-                pass
-        raise
+                async with ep.sem:
+                    # Every request sent, failover included, is charged to the rate budget
+                    if self.limiter is not None:
+                        await self.limiter.acquire(tokens)
+                    resp = await ep.client.chat.completions.create(model=ep.model, **kwargs)
+                ep.last_failure = None
+                return resp
+            except Exception as e:
+                if not is_retryable(e):
+                    # The request is at fault, not the endpoint
+                    raise
+                ep.last_failure = time.monotonic()
+                last_error = e
+            finally:
+                ep.in_flight -= 1
+        raise last_error
+
+def build_judge_pool(args, limiter=None):
+    specs = args.endpoints or [{}]
+    return JudgePool([
+        JudgeEndpoint(
+            base_url=spec.get("base_url", POE_BASE_URL),
+            model=spec.get("model", args.judge_model),
+            concurrency=int(spec.get("concurrency", args.concurrency)),
+            api_key=spec.get("api_key", args.poe_api_key),
+        )
+        for spec in specs
+    ], limiter=limiter)
+
+# Completion tokens also count against TPM; judge replies are a short JSON verdict
+DEFAULT_OUTPUT_TOKENS = 256
 
-def judge_with_poe(client, judge_model, example, model_response, max_retries=3):
+async def judge_with_poe(pool, example, model_response, max_retries=3, cache=None, prompt_cache_key=False,
+                         output_tokens=DEFAULT_OUTPUT_TOKENS):
+    judge_model = pool.judge_model
+    key = None
+    if cache is not None:
+        key = LLMCache.make_key(judge_model, example, model_response)
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+    user_prompt = build_user_prompt(example, model_response)
+    # Routes requests sharing a system+prefix block to the same provider-side prompt cache
+    extra = {"extra_body": {"prompt_cache_key": get_prompt_cache_key(example)}} if prompt_cache_key else {}
+    estimated_tokens = estimate_tokens(judge_model, JUDGE_SYSTEM + user_prompt) + output_tokens if pool.limiter is not None else 0
     for attempt in range(max_retries):
         try:
-            resp = client.chat.completions.create(
-                model=judge_model,
+            resp = await pool.create(
+                tokens=estimated_tokens,
                 temperature=0,
                 messages=[
                     {"role":"system", "content": JUDGE_SYSTEM},
-                    {"role":"user", "content": build_user_prompt(example, model_response)},
+                    {"role":"user", "content": user_prompt},
                 ],
+                **extra,
             )
             content = resp.choices[0].message.content
             data = parse_json_reply(content)
@@ -93,12 +403,130 @@ def judge_with_poe(client, judge_model, example, model_response, max_retries=3):
                 score = 1.0 if str(score_raw).strip() in {"1", "true", "True"} else 0.0
             score = 1.0 if score >= 0.5 else 0.0
             explanation = str(data.get("explanation", "")).strip()
-            return score, explanation
+            break
         except Exception as e:
-            if attempt == max_retries - 1:
+            if attempt == max_retries - 1 or not is_retryable(e):
                 return 0.0, f"Judging failed: {e}"
-            time.sleep(1.5 * (attempt + 1))
-    return 0.0, "Judging failed."
+            await asyncio.sleep(get_retry_delay(e, attempt))
+    else:
+        return 0.0, "Judging failed."
+    # Only successful verdicts are cached so failures are retried on the next run. A cache that cannot
+    # be written (locked by another run, disk full) must not turn a real verdict into a failed one.
+    if cache is not None:
+        try:
+            cache.set(key, score, explanation)
+        except sqlite3.Error as e:
+            print(f"Warning: could not cache judge verdict: {e}")
+    return score, explanation
+
+class ProgressReporter:
+    def __init__(self, total, enabled, every):
+        self.total = total
+        self.enabled = enabled
+        self.every = max(1, every)
+        self.bar = get_tqdm_progress(total) if enabled else None
+        self.processed = 0
+        self.skipped = 0
+        self.start_time = time.time()
+
+    def update(self, skipped=False):
+        self.processed += 1
+        if skipped:
+            self.skipped += 1
+        if self.bar is not None:
+            self.bar.update(1)
+        elif self.enabled and (self.processed == 1 or self.processed % self.every == 0 or self.processed == self.total):
+            elapsed = time.time() - self.start_time
+            rate = self.processed / elapsed if elapsed > 0 else 0.0
+            print(f"Judging progress: {self.processed}/{self.total} ({self.processed*100//max(1,self.total)}%), ~{rate:.2f} ex/s (skipped {self.skipped})")
+
+    def close(self):
+        if self.bar is not None:
+            self.bar.close()
+        if self.enabled:
+            elapsed = time.time() - self.start_time
+            rate = self.processed / elapsed if elapsed > 0 else 0.0
+            print(f"Done. Processed {self.processed} (judged {self.processed - self.skipped}, skipped {self.skipped}) in {elapsed:.1f}s (~{rate:.2f} ex/s)")
+
+async def run(args):
+    if args.append and os.path.exists(args.generations_out) and os.path.samefile(args.generations_in, args.generations_out):
+        raise SystemExit("--append cannot write into --generations_in; drop --append to re-judge it in place")
+
+    limiter = AsyncRateLimiter(args.rpm, args.tpm) if (args.rpm or args.tpm) else None
+    pool = build_judge_pool(args, limiter)
+    cache = None if args.no_cache else LLMCache(args.cache_path)
+
+    # Index dataset by id/example_id for rubric/category/etc.
+    data_by_id = build_dataset_index(args.dataset)
+
+    total_examples = count_lines(args.generations_in)
+    progress = ProgressReporter(total_examples, bool(args.progress), args.progress_every)
+
+    existing_ids = load_existing_ids(args.generations_out) if args.append else set()
+    if args.progress and existing_ids:
+        print(f"Resuming: found {len(existing_ids)} existing judged rows in output")
+
+    # Rows go out as pre-encoded bytes through a large buffer; close() flushes the tail
+    writer = JsonlWriter(args.generations_out, append=args.append)
+
+    # reader -> in_q -> judge workers -> writer thread; the bounded queue caps rows in flight
+    num_workers = pool.concurrency
+    in_q = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    async def reader():
+        # Raw lines travel with their parsed rows so the writer can splice verdicts into the original bytes
+        rows = ((line, json_loads(line)) for line in iter_jsonl_lines(args.generations_in))
+        while True:
+            # Parse off the event loop, a batch per thread hop
+            batch = await asyncio.to_thread(lambda: list(itertools.islice(rows, READ_BATCH_SIZE)))
+            if not batch:
+                break
+            for line, row in batch:
+                row_id = get_row_id(row)
+                if row_id in existing_ids:
+                    progress.update(skipped=True)
+                else:
+                    await in_q.put((row_id, line, row))
+        for _ in range(num_workers):
+            await in_q.put(None)
+
+    async def worker():
+        while True:
+            item = await in_q.get()
+            if item is None:
+                return
+            row_id, line, row = item
+            ex = data_by_id.get(row_id, {})
+            response_text = row.get("response") or row.get("generation") or ""
+            score, explanation = await judge_with_poe(
+                pool, ex, response_text, max_retries=args.max_retries, cache=cache,
+                prompt_cache_key=args.prompt_cache_key, output_tokens=args.output_tokens,
+            )
+            fields = {"score": score, "explanation": explanation}
+            # Optional: also include image URL from dataset if not present on the row
+            if "image" not in row:
+                if "media_url" in ex:
+                    fields["image"] = ex["media_url"]
+                elif "image" in ex:
+                    fields["image"] = ex["image"]
+            await writer.write(line, row, fields)
+            progress.update()
+
+    succeeded = False
+    try:
+        await asyncio.gather(reader(), *(worker() for _ in range(num_workers)))
+        succeeded = True
+    finally:
+        try:
+            # A failed fresh run leaves any existing --generations_out untouched
+            writer.close(commit=succeeded)
+        finally:
+            if cache is not None:
+                try:
+                    cache.close()
+                except sqlite3.Error as e:
+                    print(f"Warning: could not save cached judge verdicts: {e}")
+    progress.close()
 
 def main():
     ap = argparse.ArgumentParser()
@@ -107,93 +535,30 @@ def main():
     ap.add_argument("--generations_out", required=True)
     ap.add_argument("--judge_model", default="GPT-5")
     ap.add_argument("--poe_api_key", default=os.getenv("POE_API_KEY"))
+    ap.add_argument("--concurrency", type=int, default=32, help="Maximum number of judge requests in flight")
+    ap.add_argument("--endpoints", type=json.loads, default=None,
+                    help='JSON list of judge endpoints, e.g. [{"base_url": ..., "model": ..., "concurrency": ..., "api_key": ...}]; '
+                         "missing fields default to the Poe endpoint, --judge_model, --concurrency and --poe_api_key")
+    ap.add_argument("--max_retries", type=int, default=3, help="Attempts per example before recording a failed judgement; a 429's Retry-After "
+                         f"is waited out in full (up to {MAX_RETRY_AFTER:.0f}s), other failures back off exponentially up to {MAX_BACKOFF:.0f}s")
+    ap.add_argument("--rpm", type=int, default=0, help="Judge requests per minute budget (0 = unlimited)")
+    ap.add_argument("--tpm", type=int, default=0, help="Judge tokens per minute budget, prompt plus output (0 = unlimited)")
+    ap.add_argument("--output_tokens", type=int, default=DEFAULT_OUTPUT_TOKENS,
+                    help="Completion tokens budgeted per judge call when enforcing --tpm")
+    ap.add_argument("--prompt_cache_key", action="store_true",
+                    help="Send a prompt_cache_key per example so OpenAI-compatible endpoints reuse the cached rubric prefix")
+    ap.add_argument("--cache_path", default=DEFAULT_CACHE_PATH, help="SQLite file caching verdicts across runs")
+    ap.add_argument("--no_cache", action="store_true", help="Always call the judge, bypassing the verdict cache")
     ap.add_argument("--progress", action="store_true", help="Show progress updates while judging")
     ap.add_argument("--progress_every", type=int, default=10, help="If tqdm is unavailable, print every N examples")
     ap.add_argument("--append", action="store_true", help="Append to generations_out and resume (skip already judged ids)")
-    ap.add_argument("--stream_write", action="store_true", help="Write each result line immediately instead of batching")
+    ap.add_argument("--stream_write", action="store_true", help="Kept for compatibility; results are always written as they complete")
     args = ap.parse_args()
 
-    if not args.poe_api_key:
+    if not args.poe_api_key and not (args.endpoints and all(ep.get("api_key") for ep in args.endpoints)):
         raise SystemExit("Set POE_API_KEY env var or pass --poe_api_key")
 
-    client = OpenAI(api_key=args.poe_api_key, base_url="https://api.poe.com/v1")
-
-    # Index dataset by id/example_id for rubric/category/etc.
-    data_by_id = {}
-    for ex in load_jsonl(args.dataset):
-        ex_id = ex.get("id") or ex.get("example_id") or ex.get("exampleId")
-        if not ex_id:
-            continue
-        data_by_id[ex_id] = ex
-
-    total_examples = count_lines(args.generations_in)
-    use_progress = bool(args.progress)
-    progress_bar = get_tqdm_progress(total_examples) if use_progress else None
-    printed = 0
-    start_time = time.time()
-
-    existing_ids = load_existing_ids(args.generations_out) if args.append else set()
-    if use_progress and existing_ids:
-        print(f"Resuming: found {len(existing_ids)} existing judged rows in output")
-
-    out_file = None
-    if args.append:
-        out_file = open(args.generations_out, "a")
-    elif args.stream_write:
-        out_file = open(args.generations_out, "w")
-
-    out_rows = []
-    processed = 0
-    skipped = 0
-    for row in load_jsonl(args.generations_in):
-        row_id = row.get("id") or row.get("example_id") or row.get("exampleId")
-        if row_id in existing_ids:
-            skipped += 1
-            processed += 1
-            if progress_bar is not None:
-                progress_bar.update(1)
-            elif use_progress and (processed == 1 or processed % max(1, args.progress_every) == 0 or processed == total_examples):
-                elapsed = time.time() - start_time
-                rate = processed / elapsed if elapsed > 0 else 0.0
-                print(f"Judging progress: {processed}/{total_examples} ({processed*100//max(1,total_examples)}%), ~{rate:.2f} ex/s (skipped {skipped})")
-            continue
-        ex = data_by_id.get(row_id, {})
-        response_text = row.get("response") or row.get("generation") or ""
-        score, explanation = judge_with_poe(client, args.judge_model, ex, response_text)
-        row["score"] = score
-        row["explanation"] = explanation
-        # Optional: also include image URL from dataset if not present on the row
-        if "image" not in row:
-            if "media_url" in ex:
-                row["image"] = ex["media_url"]
-            elif "image" in ex:
-                row["image"] = ex["image"]
-        if out_file is not None:
-            out_file.write(json.dumps(row, ensure_ascii=False) + "\n")
-            if not progress_bar and use_progress and (processed % max(1, args.progress_every) == 0):
-                out_file.flush()
-        else:
-            out_rows.append(row)
-        processed += 1
-        if progress_bar is not None:
-            progress_bar.update(1)
-        elif use_progress and (processed == 1 or processed % max(1, args.progress_every) == 0 or processed == total_examples):
-            elapsed = time.time() - start_time
-            rate = processed / elapsed if elapsed > 0 else 0.0
-            print(f"Judging progress: {processed}/{total_examples} ({processed*100//max(1,total_examples)}%), ~{rate:.2f} ex/s (skipped {skipped})")
-
-    if out_file is not None:
-        out_file.flush()
-        out_file.close()
-    else:
-        save_jsonl(args.generations_out, out_rows)
-    if progress_bar is not None:
-        progress_bar.close()
-    if use_progress:
-        elapsed = time.time() - start_time
-        total_written = processed - skipped if out_rows is None else len(out_rows)
-        rate = (processed) / elapsed if elapsed > 0 else 0.0
-        print(f"Done. Processed {processed} (judged {processed - skipped}, skipped {skipped}) in {elapsed:.1f}s (~{rate:.2f} ex/s)")
+    asyncio.run(run(args))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -10,6 +10,10 @@ from typing import Dict, Any
 import os
 import re
 
+# Markdown image tags and bare URLs, stripped in a single pass
+_STRIP_RE = re.compile(r"!\[[^\]]*\]\([^\)]+\)|https?://\S+")
+_WS_RE = re.compile(r"\s+")
+
 
 class PoeModel(BaseVisionModel):
     """Poe model implementation via OpenAI-compatible API."""
@@ -24,12 +28,10 @@ class PoeModel(BaseVisionModel):
         """Remove markdown image tags and bare URLs from content."""
         if not content:
             return content
-        # Strip markdown image tags
-        cleaned = re.sub(r"!\[[^\]]*\]\([^\)]+\)", "", content)
-        # Strip bare URLs
-        cleaned = re.sub(r"https?://\S+", "", cleaned)
+        # Strip markdown image tags and bare URLs
+        cleaned = _STRIP_RE.sub("", content)
         # Collapse excessive whitespace
-        cleaned = re.sub(r"\s+", " ", cleaned).strip()
+        cleaned = _WS_RE.sub(" ", cleaned).strip()
         return cleaned or content
 
     def generate_response(self, example: Dict[str, Any]) -> str:
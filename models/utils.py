@@ -1,8 +1,87 @@
-from typing import Tuple
+from typing import Any, Iterator, List, Optional, Sequence, Tuple, Union
+import asyncio
+import json
+import os
+import pickle
 import httpx
 from pathlib import Path
 import time
 
+try:
+    import orjson  # type: ignore
+
+    json_loads = orjson.loads
+
+    def json_dumps(obj: object) -> bytes:
+        """Encode obj as compact UTF-8 JSON bytes."""
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj: object) -> bytes:
+        """Encode obj as compact UTF-8 JSON bytes."""
+        return json.dumps(obj, ensure_ascii=False).encode()
+
+
+def iter_jsonl_lines(path: Union[str, Path]) -> Iterator[bytes]:
+    """Yield the raw non-blank lines of a JSONL file."""
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.isspace():
+                yield line
+
+
+def load_jsonl(path: Union[str, Path]) -> Iterator[Any]:
+    """Yield each parsed row of a JSONL file."""
+    for line in iter_jsonl_lines(path):
+        yield json_loads(line)
+
+
+def load_dataset_rows(path: Union[str, Path]) -> List[Any]:
+    """Load a dataset JSONL, reusing a pickled copy of the parsed rows when it is current.
+
+    The rows are pickled to `<path>.idx` together with the JSONL's size and mtime and
+    reused only while both match exactly, so an older file copied over the dataset is
+    still re-parsed. The cache is unpickled, so only use this on a directory you trust.
+
+    Args:
+        path: Path to the dataset JSONL
+
+    Returns:
+        List of parsed rows
+    """
+    idx_path = f"{os.fspath(path)}.idx"
+    st = os.stat(path)
+    source = (st.st_size, st.st_mtime_ns)
+    try:
+        with open(idx_path, "rb") as f:
+            cached_source, rows = pickle.load(f)
+        if cached_source == source:
+            return rows
+    except Exception:
+        pass
+    rows = list(load_jsonl(path))
+    tmp_path = f"{idx_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((source, rows), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, idx_path)
+    except OSError:
+        # Read-only dataset directory: just parse the JSONL every run
+        pass
+    return rows
+
+
+def get_first_value(row: dict, keys: Sequence[str]) -> Optional[Any]:
+    """Return the first truthy value among keys, e.g. a row's id under the caller's precedence."""
+    for key in keys:
+        value = row.get(key)
+        if value:
+            return value
+    return None
+
+
 def validate_image_url(media_url: str) -> Tuple[str, str]:
     """Validate image URL and return media type.
     
@@ -58,4 +137,58 @@ class RateLimiter:
             time.sleep(self.time_window)
             self.requests = 0
         
-        self.requests += 1
\ No newline at end of file
+        self.requests += 1
+
+class AsyncRateLimiter:
+    """Token-bucket rate limiter for asyncio API calls.
+
+    Tracks a requests-per-minute and a tokens-per-minute budget. Both buckets
+    refill continuously, so callers wait only as long as the budget requires.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        """Initialize rate limiter.
+
+        Args:
+            rpm: Maximum requests per minute (None or 0 for unlimited)
+            tpm: Maximum tokens per minute (None or 0 for unlimited)
+        """
+        self.rpm = rpm or 0
+        self.tpm = tpm or 0
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until one request and `tokens` tokens fit in the budget, then spend them.
+
+        Args:
+            tokens: Estimated tokens for the request (clamped to the per-minute budget)
+        """
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        # Holding the lock while sleeping serves waiters in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60.0 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60.0 / self.tpm)
+                if wait <= 0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+                await asyncio.sleep(wait)
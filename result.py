@@ -15,27 +15,59 @@ It will:
 from __future__ import annotations
 
 import argparse
+import dataclasses
 import json
 import os
-from collections import defaultdict
+from array import array
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import numba  # type: ignore
+except ImportError:
+    numba = None
+
+from models.utils import get_first_value, json_dumps, json_loads, load_dataset_rows
+
+# Only the fields result.py reads from a judged row. Fields are loosely typed so odd rows still decode;
+# with msgspec, every other key is skipped without being materialized.
+_JUDGED_ROW_FIELDS = [
+    (name, Any, None)
+    for name in (
+        "example_id",
+        "id",
+        "exampleId",
+        "generation",
+        "response",
+        "score",
+        "explanation",
+        "evaluator_explanation",
+    )
+]
 
+try:
+    import msgspec  # type: ignore
 
-def load_jsonl(path: Path) -> Iterable[dict]:
-    with path.open("r") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            yield json.loads(line)
+    JudgedRow = msgspec.defstruct("JudgedRow", _JUDGED_ROW_FIELDS, kw_only=True)
+    _judged_row_decoder = msgspec.json.Decoder(JudgedRow)
+    _decode_judged_row = _judged_row_decoder.decode
 
+except ImportError:
+    JudgedRow = dataclasses.make_dataclass("JudgedRow", _JUDGED_ROW_FIELDS)
 
-def save_jsonl(path: Path, rows: Iterable[dict]) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w") as f:
-        for row in rows:
-            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    def _decode_judged_row(line: bytes) -> Any:
+        row = json_loads(line)
+        return JudgedRow(**{name: row.get(name) for name, _, _ in _JUDGED_ROW_FIELDS})
+
+
+def load_judged_rows(path: Path) -> Iterable[Any]:
+    with path.open("rb") as f:
+        for line in f:
+            if line.isspace():
+                continue
+            yield _decode_judged_row(line)
 
 
 def parse_args() -> argparse.Namespace:
@@ -67,39 +99,79 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+_ID_KEYS = ("example_id", "id", "exampleId")
+
+
+def get_example_id(row: dict) -> Optional[str]:
+    return get_first_value(row, _ID_KEYS)
+
+
 def build_dataset_index(dataset_path: Path) -> Dict[str, dict]:
-    dataset_index: Dict[str, dict] = {}
-    for example in load_jsonl(dataset_path):
-        example_id = example.get("example_id") or example.get("id") or example.get("exampleId")
-        if not example_id:
-            continue
-        dataset_index[example_id] = example
-    return dataset_index
+    return {
+        example_id: example for example in load_dataset_rows(dataset_path) if (example_id := get_example_id(example))
+    }
+
+
+def to_numeric_score(score: object) -> Optional[float]:
+    if score is None:
+        return None
+    try:
+        return float(score)
+    except Exception:
+        return None
+
+
+# Below this many scores np.bincount wins over paying numba's JIT/thread start-up
+NUMBA_MIN_ROWS = 1_000_000
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _group_sums_numba(
+        inverse: np.ndarray, scores: np.ndarray, num_groups: int, num_chunks: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # Each thread accumulates its own contiguous chunk; indexed += across prange iterations would race
+        n = inverse.shape[0]
+        chunk_size = (n + num_chunks - 1) // num_chunks
+        sums = np.zeros((num_chunks, num_groups))
+        counts = np.zeros((num_chunks, num_groups), dtype=np.int64)
+        for chunk in numba.prange(num_chunks):
+            for i in range(chunk * chunk_size, min(n, (chunk + 1) * chunk_size)):
+                sums[chunk, inverse[i]] += scores[i]
+                counts[chunk, inverse[i]] += 1
+        return sums.sum(axis=0), counts.sum(axis=0)
+
+
+def group_percentages(categories: List[str], scores: np.ndarray) -> Tuple[Dict[str, float], float]:
+    if len(scores) == 0:
+        return {}, 0.0
+
+    # Per-category means in one vectorized group-by: bincount sums scores per category index.
+    # Codes come from a dict rather than np.unique, which sorts Python strings and dominates at scale.
+    codes: Dict[str, int] = {}
+    inverse = np.fromiter((codes.setdefault(c, len(codes)) for c in categories), dtype=np.int64, count=len(categories))
+    keys = list(codes)
+    if numba is not None and len(scores) >= NUMBA_MIN_ROWS:
+        sums, counts = _group_sums_numba(inverse, scores, len(keys), numba.get_num_threads())
+    else:
+        sums = np.bincount(inverse, weights=scores)
+        counts = np.bincount(inverse)
+    percentages = {str(key): float(pct) for key, pct in zip(keys, 100.0 * sums / counts)}
+
+    overall = 100.0 * float(scores.mean())
+    return percentages, overall
 
 
 def compute_percentages(rows: List[dict]) -> Tuple[Dict[str, float], float]:
-    scores_by_category: Dict[str, List[float]] = defaultdict(list)
+    categories: List[str] = []
+    scores: List[float] = []
     for row in rows:
-        category = row.get("category") or row.get("category_name") or "unknown"
-        score = row.get("score")
-        if score is None:
-            continue
-        try:
-            numeric = float(score)
-        except Exception:
-            continue
-        scores_by_category[category].append(numeric)
-
-    percentages: Dict[str, float] = {}
-    for category, scores in scores_by_category.items():
-        if not scores:
+        numeric = to_numeric_score(row.get("score"))
+        if numeric is None:
             continue
-        percentages[category] = 100.0 * (sum(scores) / len(scores))
-
-    # overall
-    all_scores = [s for lst in scores_by_category.values() for s in lst]
-    overall = 100.0 * (sum(all_scores) / len(all_scores)) if all_scores else 0.0
-    return percentages, overall
+        categories.append(row.get("category") or row.get("category_name") or "unknown")
+        scores.append(numeric)
+    return group_percentages(categories, np.asarray(scores, dtype=np.float64))
 
 
 def main() -> None:
@@ -107,38 +179,45 @@ def main() -> None:
 
     dataset_index = build_dataset_index(args.data)
 
-    detailed_rows: List[dict] = []
+    # Single pass: write each detailed row as it is joined and keep only (category, score) for the summary
+    categories: List[str] = []
+    scores = array("d")
+    written = 0
     missing = 0
-    for row in load_jsonl(args.generations):
-        example_id = row.get("example_id") or row.get("id") or row.get("exampleId")
-        if not example_id:
-            continue
-        ds = dataset_index.get(example_id)
-        if ds is None:
-            missing += 1
-            continue
-        detailed_rows.append(
-            {
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with args.output.open("wb") as f:
+        for row in load_judged_rows(args.generations):
+            example_id = row.example_id or row.id or row.exampleId
+            if not example_id:
+                continue
+            ds = dataset_index.get(example_id)
+            if ds is None:
+                missing += 1
+                continue
+            detailed = {
                 "example_id": example_id,
                 "category": ds.get("category"),
                 "prompt": ds.get("prompt"),
                 "reference": ds.get("reference") or ds.get("rubric"),
                 "image": ds.get("media_url") or ds.get("image"),
-                "generation": row.get("generation") or row.get("response"),
-                "score": row.get("score"),
-                "explanation": row.get("explanation") or row.get("evaluator_explanation"),
+                "generation": row.generation or row.response,
+                "score": row.score,
+                "explanation": row.explanation or row.evaluator_explanation,
             }
-        )
+            f.write(json_dumps(detailed) + b"\n")
+            written += 1
+            numeric = to_numeric_score(detailed["score"])
+            if numeric is not None:
+                categories.append(detailed["category"] or "unknown")
+                scores.append(numeric)
 
     if missing:
         print(f"Warning: {missing} judged rows had example_ids not found in dataset {args.data}")
 
-    # Write detailed results
-    save_jsonl(args.output, detailed_rows)
-    print(f"Output {len(detailed_rows)} examples to {args.output}.")
+    print(f"Output {written} examples to {args.output}.")
 
     # Compute and print README-style table
-    per_category, overall = compute_percentages(detailed_rows)
+    per_category, overall = group_percentages(categories, np.frombuffer(scores, dtype=np.float64))
     print("\n| Category           |  Score (%)   |")
     print("|--------------------|--------------|")
     for category in sorted(per_category.keys()):
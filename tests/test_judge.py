@@ -0,0 +1,516 @@
+import argparse
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import judge
+from judge import (
+    JudgeEndpoint,
+    JudgePool,
+    JsonlWriter,
+    LLMCache,
+    MAX_BACKOFF,
+    MAX_RETRY_AFTER,
+    encode_judged_row,
+    get_retry_after,
+    get_retry_delay,
+    get_row_id,
+    load_existing_ids,
+    parse_json_reply,
+)
+
+
+def test__parse_json_reply():
+    assert parse_json_reply('{"score": 1, "explanation": "ok"}') == {"score": 1, "explanation": "ok"}
+
+
+def test__parse_json_reply__wrapped_in_prose():
+    text = 'Here is my verdict:\n```json\n{"score": 0, "explanation": "uses {braces}"}\n```\nThanks.'
+    assert parse_json_reply(text) == {"score": 0, "explanation": "uses {braces}"}
+
+
+def test__parse_json_reply__no_json():
+    with pytest.raises(ValueError):
+        parse_json_reply("score: 1")
+
+
+def test__encode_judged_row():
+    line = b'{"example_id": "a", "generation": "caf\xc3\xa9 {x}"}\n'
+    fields = {"score": 1.0, "explanation": "ok"}
+    encoded = encode_judged_row(line, json.loads(line), fields)
+    assert encoded.endswith(b"}\n")
+    assert json.loads(encoded) == {"example_id": "a", "generation": "café {x}", "score": 1.0, "explanation": "ok"}
+
+
+def test__encode_judged_row__empty_row():
+    assert json.loads(encode_judged_row(b"{}\n", {}, {"score": 0.0})) == {"score": 0.0}
+
+
+def test__encode_judged_row__already_judged():
+    line = b'{"example_id": "a", "score": 0.0, "explanation": "old"}'
+    encoded = encode_judged_row(line, json.loads(line), {"score": 1.0, "explanation": "new"})
+    assert encoded.count(b'"score"') == 1
+    assert json.loads(encoded) == {"example_id": "a", "score": 1.0, "explanation": "new"}
+
+
+_EXAMPLE = {"prompt": "p", "reference": "r", "category": "c"}
+
+
+def test__llm_cache__round_trip(tmp_path):
+    cache = LLMCache(str(tmp_path / "nested" / "judge.db"))
+    key = LLMCache.make_key("GPT-5", _EXAMPLE, "resp")
+    assert cache.get(key) is None
+    cache.set(key, 1.0, "ok")
+    cache.close()
+
+    reopened = LLMCache(str(tmp_path / "nested" / "judge.db"))
+    assert reopened.get(key) == (1.0, "ok")
+    reopened.set(key, 0.0, "overwritten")
+    assert reopened.get(key) == (0.0, "overwritten")
+    reopened.close()
+
+
+def test__llm_cache__batches_writes(tmp_path):
+    path = str(tmp_path / "judge.db")
+    cache = LLMCache(path)
+    other = LLMCache(path)
+    key = LLMCache.make_key("GPT-5", _EXAMPLE, "resp")
+    cache.set(key, 1.0, "ok")
+    # Buffered verdicts are visible to their own cache straight away and to other runs once flushed
+    assert cache.get(key) == (1.0, "ok")
+    assert other.get(key) is None
+    cache.close()
+    assert other.get(key) == (1.0, "ok")
+    other.close()
+
+
+def test__llm_cache__make_key():
+    key = LLMCache.make_key("GPT-5", _EXAMPLE, "resp")
+    # Pinned so a change to the key format (which orphans existing caches) is deliberate
+    assert key == "1910ffdf44dd9bfca5fa9d9b45d66f9d4b7464634646ead0a22e5ee27bcdd52b"
+    assert LLMCache.make_key("GPT-5", dict(_EXAMPLE), "resp") == key
+    assert LLMCache.make_key("Claude", _EXAMPLE, "resp") != key
+    assert LLMCache.make_key("GPT-5", _EXAMPLE, "other resp") != key
+    assert LLMCache.make_key("GPT-5", {**_EXAMPLE, "reference": "other"}, "resp") != key
+
+
+def _write_lines(path, lines):
+    path.write_bytes(b"".join(lines))
+    return str(path)
+
+
+def test__load_existing_ids(tmp_path):
+    path = _write_lines(
+        tmp_path / "out.jsonl",
+        [
+            b'{"example_id": "vibe-eval/a_1", "generation": "says \\"id\\": \\"not-this\\""}\n',
+            b'{"id": 7, "score": 1.0}\n',
+            b'{"exampleId": "q\\"z"}\n',
+            b"\n",
+            b'{"example_id": "trunc',
+        ],
+    )
+    assert load_existing_ids(path) == {"vibe-eval/a_1", 7, 'q"z'}
+
+
+def test__load_existing_ids__matches_get_row_id_precedence(tmp_path):
+    rows = [
+        {"example_id": "ex-1", "id": "id-1"},
+        {"id": "", "example_id": "ex-2"},
+        {"meta": {"id": "nested"}, "id": "id-3"},
+    ]
+    path = _write_lines(tmp_path / "out.jsonl", [json.dumps(row).encode() + b"\n" for row in rows])
+    assert load_existing_ids(path) == {get_row_id(row) for row in rows} == {"id-1", "ex-2", "id-3"}
+
+
+def test__load_existing_ids__missing_file(tmp_path):
+    assert load_existing_ids(str(tmp_path / "missing.jsonl")) == set()
+
+
+class _StubCompletions:
+    def __init__(self, fail, error=None):
+        self.fail = fail
+        self.error = error or RuntimeError("endpoint down")
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise self.error
+        return kwargs["model"]
+
+
+class _CountingLimiter:
+    def __init__(self):
+        self.acquired = []
+
+    async def acquire(self, tokens=0):
+        self.acquired.append(tokens)
+
+
+def _stub_endpoint(model, concurrency, fail, error=None):
+    endpoint = JudgeEndpoint("http://localhost/v1", model, concurrency, api_key="test")
+    completions = _StubCompletions(fail, error)
+    endpoint.client = type("StubClient", (), {"chat": type("StubChat", (), {"completions": completions})()})()
+    return endpoint, completions
+
+
+def _status_error(cls, status, headers=None):
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "http://judge.test/v1"))
+    return cls(f"HTTP {status}", response=response, body=None)
+
+
+def _rate_limit_error(headers):
+    return _status_error(openai.RateLimitError, 429, headers)
+
+
+def test__judge_endpoint__disables_sdk_retries():
+    endpoint = JudgeEndpoint("http://localhost/v1", "m", 1, api_key="test")
+    assert endpoint.client.max_retries == 0
+
+
+def test__judge_pool__fails_over_and_deprioritises_failed_endpoint():
+    bad, bad_calls = _stub_endpoint("bad", concurrency=4, fail=True)
+    good, good_calls = _stub_endpoint("good", concurrency=2, fail=False)
+    limiter = _CountingLimiter()
+    pool = JudgePool([bad, good], limiter=limiter)
+
+    async def run():
+        return [await pool.create(tokens=5) for _ in range(10)]
+
+    assert asyncio.run(run()) == ["good"] * 10
+    # Only the first call tried the (larger) bad endpoint; after that it cools down
+    assert bad_calls.calls == 1
+    assert good_calls.calls == 10
+    # Every HTTP request, including the failed one, is charged to the rate budget
+    assert limiter.acquired == [5] * 11
+
+
+def test__judge_pool__raises_when_all_endpoints_fail():
+    bad, _ = _stub_endpoint("bad", concurrency=1, fail=True)
+    pool = JudgePool([bad])
+    with pytest.raises(RuntimeError, match="endpoint down"):
+        asyncio.run(pool.create())
+
+
+def test__judge_pool__fails_over_on_transient_errors():
+    for error in (
+        _status_error(openai.InternalServerError, 503),
+        _rate_limit_error({}),
+        openai.APITimeoutError(httpx.Request("POST", "http://judge.test/v1")),
+    ):
+        bad, _ = _stub_endpoint("bad", concurrency=4, fail=True, error=error)
+        good, _ = _stub_endpoint("good", concurrency=2, fail=False)
+        assert asyncio.run(JudgePool([bad, good]).create()) == "good"
+        assert bad.last_failure is not None
+
+
+def test__judge_pool__raises_request_errors_without_failover():
+    error = _status_error(openai.BadRequestError, 400)
+    first, first_calls = _stub_endpoint("first", concurrency=4, fail=True, error=error)
+    second, second_calls = _stub_endpoint("second", concurrency=2, fail=True, error=error)
+    with pytest.raises(openai.BadRequestError):
+        asyncio.run(JudgePool([first, second]).create())
+    # A bad request is sent once, and neither endpoint is marked unhealthy for it
+    assert (first_calls.calls, second_calls.calls) == (1, 0)
+    assert first.last_failure is None and second.last_failure is None
+
+
+def test__judge_with_poe__does_not_retry_request_errors(monkeypatch):
+    endpoint, calls = _stub_endpoint("GPT-5", concurrency=1, fail=True, error=_status_error(openai.BadRequestError, 400))
+    sleeps = []
+
+    async def sleep(delay):
+        sleeps.append(delay)
+
+    monkeypatch.setattr(judge.asyncio, "sleep", sleep)
+    score, explanation = asyncio.run(judge.judge_with_poe(JudgePool([endpoint]), _EXAMPLE, "resp", max_retries=3))
+    assert score == 0.0 and explanation.startswith("Judging failed")
+    assert calls.calls == 1
+    assert sleeps == []
+
+
+def test__jsonl_writer(tmp_path):
+    path = tmp_path / "out.jsonl"
+    writer = JsonlWriter(str(path))
+    asyncio.run(writer.write(b'{"example_id": "a"}\n', {"example_id": "a"}, {"score": 1.0}))
+    # Nothing lands at the output path until close()
+    assert not path.exists()
+    writer.close()
+    assert [json.loads(line) for line in path.read_bytes().splitlines()] == [{"example_id": "a", "score": 1.0}]
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test__jsonl_writer__surfaces_thread_errors(tmp_path):
+    writer = JsonlWriter(str(tmp_path / "out.jsonl"))
+    file = writer.file
+
+    class DiskFull:
+        closed = False
+
+        def write(self, data):
+            raise OSError(28, "No space left on device")
+
+        def close(self):
+            self.closed = True
+            file.close()
+
+    writer.file = DiskFull()
+    asyncio.run(writer.write(b'{"example_id": "a"}\n', {"example_id": "a"}, {"score": 1.0}))
+    writer.future.exception(timeout=5)
+    # The next write fails fast instead of queueing more judged rows
+    with pytest.raises(OSError, match="No space left"):
+        asyncio.run(writer.write(b'{"example_id": "b"}\n', {"example_id": "b"}, {"score": 0.0}))
+    assert writer.file.closed
+    with pytest.raises(OSError, match="No space left"):
+        writer.close()
+    # The half-written temp file is discarded rather than replacing the output
+    assert list(tmp_path.iterdir()) == []
+
+
+def test__jsonl_writer__backpressure_does_not_block_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(judge, "QUEUE_SIZE", 1)
+    path = tmp_path / "out.jsonl"
+    writer = JsonlWriter(str(path))
+    file = writer.file
+    unblock = threading.Event()
+
+    class StalledDisk:
+        def write(self, data):
+            unblock.wait(5)
+            return file.write(data)
+
+        def close(self):
+            file.close()
+
+    writer.file = StalledDisk()
+
+    async def write_rows():
+        for i in range(4):
+            row = {"example_id": str(i)}
+            await writer.write(json.dumps(row).encode() + b"\n", row, {"score": 1.0})
+
+    async def scenario():
+        # The event loop keeps ticking while writes wait on the full queue; the disk recovers on tick 5
+        writes = asyncio.ensure_future(write_rows())
+        ticks = 0
+        while not writes.done():
+            ticks += 1
+            if ticks == 5:
+                unblock.set()
+            await asyncio.sleep(0.01)
+        await writes
+        return ticks
+
+    assert asyncio.run(scenario()) >= 5
+    writer.close()
+    assert len(path.read_bytes().splitlines()) == 4
+
+
+def test__get_retry_after():
+    assert get_retry_after(_rate_limit_error({"retry-after": "7"})) == 7.0
+    assert get_retry_after(_rate_limit_error({"retry-after-ms": "1500", "retry-after": "7"})) == 1.5
+    assert get_retry_after(_rate_limit_error({})) is None
+    assert get_retry_after(_rate_limit_error({"retry-after": "soon"})) is None
+    assert get_retry_after(ValueError("not a 429")) is None
+
+
+def test__get_retry_after__http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    delay = get_retry_after(_rate_limit_error({"retry-after": format_datetime(retry_at, usegmt=True)}))
+    assert 28.0 <= delay <= 30.0
+    past = datetime.now(timezone.utc) - timedelta(seconds=30)
+    assert get_retry_after(_rate_limit_error({"retry-after": format_datetime(past, usegmt=True)})) == 0.0
+
+
+def test__get_retry_delay():
+    assert 7.0 <= get_retry_delay(_rate_limit_error({"retry-after": "7"}), attempt=0) <= 8.0
+    assert 2.0 <= get_retry_delay(ValueError("boom"), attempt=1) <= 3.0
+    assert MAX_BACKOFF <= get_retry_delay(ValueError("boom"), attempt=10) <= MAX_BACKOFF + 1
+    # A server-supplied wait longer than our own backoff cap is honoured, within its own larger cap
+    assert 120.0 <= get_retry_delay(_rate_limit_error({"retry-after": "120"}), attempt=0) <= 121.0
+    assert MAX_RETRY_AFTER <= get_retry_delay(_rate_limit_error({"retry-after": "86400"}), attempt=0) <= MAX_RETRY_AFTER + 1
+
+
+class _JudgeCompletions:
+    # Scores a response 1 when it contains "good"
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        score = int("good" in messages[-1]["content"])
+        content = json.dumps({"score": score, "explanation": "stub"})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _run_args(tmp_path, **overrides):
+    dataset = _write_lines(
+        tmp_path / "dataset.jsonl",
+        [
+            b'{"example_id": "a", "prompt": "p", "reference": "r", "category": "c", "media_url": "http://img/a.png"}\n',
+            b'{"example_id": "b", "prompt": "p", "reference": "r", "category": "c"}\n',
+        ],
+    )
+    generations = _write_lines(
+        tmp_path / "generations.jsonl",
+        [
+            b'{"example_id": "a", "generation": "good answer"}\n',
+            b'{"example_id": "b", "generation": "bad answer", "score": 1.0, "explanation": "old"}\n',
+            b'{"example_id": "c", "generation": "good, but not in the dataset"}\n',
+        ],
+    )
+    args = dict(
+        dataset=dataset,
+        generations_in=generations,
+        generations_out=str(tmp_path / "judged.jsonl"),
+        max_retries=1,
+        rpm=0,
+        tpm=0,
+        output_tokens=judge.DEFAULT_OUTPUT_TOKENS,
+        prompt_cache_key=False,
+        cache_path=str(tmp_path / "judge.db"),
+        no_cache=True,
+        progress=False,
+        progress_every=10,
+        append=False,
+    )
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def _stub_judge_pool(completions, concurrency=2, limiter=None):
+    endpoint = JudgeEndpoint("http://localhost/v1", "GPT-5", concurrency, api_key="test")
+    endpoint.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return JudgePool([endpoint], limiter=limiter)
+
+
+def _stub_judge(monkeypatch, completions, concurrency=2):
+    monkeypatch.setattr(
+        judge, "build_judge_pool", lambda args, limiter=None: _stub_judge_pool(completions, concurrency, limiter)
+    )
+
+
+def _read_rows(path):
+    with open(path, "rb") as f:
+        return {row["example_id"]: row for row in map(json.loads, f)}
+
+
+def test__run__rejudges_in_place(tmp_path, monkeypatch):
+    completions = _JudgeCompletions()
+    _stub_judge(monkeypatch, completions)
+    args = _run_args(tmp_path)
+    args.generations_out = args.generations_in
+    asyncio.run(judge.run(args))
+    rows = _read_rows(args.generations_in)
+    assert {ex_id: row["score"] for ex_id, row in rows.items()} == {"a": 1.0, "b": 0.0, "c": 1.0}
+    assert completions.calls == 3
+    assert not [path for path in tmp_path.iterdir() if path.suffix == ".tmp"]
+
+
+def test__run__append_refuses_same_file(tmp_path, monkeypatch):
+    _stub_judge(monkeypatch, _JudgeCompletions())
+    args = _run_args(tmp_path, append=True)
+    args.generations_out = args.generations_in
+    before = open(args.generations_in, "rb").read()
+    with pytest.raises(SystemExit):
+        asyncio.run(judge.run(args))
+    assert open(args.generations_in, "rb").read() == before
+
+
+def test__judge_with_poe__cache_write_failure_keeps_verdict(tmp_path, capsys):
+    completions = _JudgeCompletions()
+    cache = LLMCache(str(tmp_path / "judge.db"))
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    cache.set = locked
+    verdict = asyncio.run(judge.judge_with_poe(_stub_judge_pool(completions), _EXAMPLE, "good", cache=cache))
+    assert verdict == (1.0, "stub")
+    assert completions.calls == 1
+    assert "database is locked" in capsys.readouterr().out
+    cache.close()
+
+
+def test__run(tmp_path, monkeypatch):
+    completions = _JudgeCompletions()
+    _stub_judge(monkeypatch, completions)
+    args = _run_args(tmp_path)
+    asyncio.run(judge.run(args))
+
+    with open(args.generations_out, "rb") as f:
+        lines = f.readlines()
+    assert len(lines) == 3
+    assert completions.calls == 3
+    rows = _read_rows(args.generations_out)
+    # Fields are spliced into the original line; the dataset's media_url fills a missing image
+    assert rows["a"] == {
+        "example_id": "a",
+        "generation": "good answer",
+        "score": 1.0,
+        "explanation": "stub",
+        "image": "http://img/a.png",
+    }
+    assert any(line.startswith(b'{"example_id": "a", "generation": "good answer",') for line in lines)
+    # An already judged row has its verdict replaced rather than duplicated
+    assert rows["b"] == {"example_id": "b", "generation": "bad answer", "score": 0.0, "explanation": "stub"}
+    # Rows missing from the dataset are still judged
+    assert rows["c"]["score"] == 1.0 and "image" not in rows["c"]
+
+
+def test__run__append_skips_existing_ids(tmp_path, monkeypatch):
+    completions = _JudgeCompletions()
+    _stub_judge(monkeypatch, completions)
+    args = _run_args(tmp_path, append=True)
+    _write_lines(tmp_path / "judged.jsonl", [b'{"example_id": "a", "score": 0.0, "explanation": "earlier"}\n'])
+    asyncio.run(judge.run(args))
+
+    assert completions.calls == 2
+    rows = _read_rows(args.generations_out)
+    assert sorted(rows) == ["a", "b", "c"]
+    assert rows["a"]["explanation"] == "earlier"
+    assert rows["c"]["explanation"] == "stub"
+
+
+def test__run__worker_error_closes_writer_and_cache(tmp_path, monkeypatch):
+    _stub_judge(monkeypatch, _JudgeCompletions())
+    writers, caches = [], []
+
+    class RecordingWriter(JsonlWriter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            writers.append(self)
+
+    class RecordingCache(LLMCache):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            caches.append(self)
+
+    async def judge_with_poe(pool, example, response_text, **kwargs):
+        if "bad" in response_text:
+            raise RuntimeError("worker crashed")
+        return 1.0, "stub"
+
+    monkeypatch.setattr(judge, "JsonlWriter", RecordingWriter)
+    monkeypatch.setattr(judge, "LLMCache", RecordingCache)
+    monkeypatch.setattr(judge, "judge_with_poe", judge_with_poe)
+    args = _run_args(tmp_path, no_cache=False)
+    with pytest.raises(RuntimeError, match="worker crashed"):
+        asyncio.run(judge.run(args))
+
+    [writer], [cache] = writers, caches
+    assert writer.future.done() and writer.file.closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        cache.get("key")
+    # The failed fresh run publishes nothing
+    assert not (tmp_path / "judged.jsonl").exists()
+    assert not [path for path in tmp_path.iterdir() if path.suffix == ".tmp"]
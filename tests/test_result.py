@@ -0,0 +1,135 @@
+import dataclasses
+import importlib.util
+import json
+import sys
+
+import pytest
+
+import result
+from result import compute_percentages
+
+
+@pytest.fixture(params=["msgspec", "dataclass"])
+def result_module(request, monkeypatch):
+    """result.py as imported, and a fresh copy loaded with msgspec hidden to exercise the dataclass fallback."""
+    if request.param == "msgspec":
+        pytest.importorskip("msgspec")
+        return result
+    monkeypatch.setitem(sys.modules, "msgspec", None)
+    spec = importlib.util.spec_from_file_location("result_without_msgspec", result.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert dataclasses.is_dataclass(module.JudgedRow)
+    return module
+
+
+def test__compute_percentages():
+    rows = [
+        {"category": "a", "score": 1},
+        {"category": "a", "score": 0.0},
+        {"category": "b", "score": "1"},
+        {"category_name": "c", "score": 0},
+        {"score": 1},
+        {"category": "a", "score": None},
+        {"category": "b", "score": "not a number"},
+    ]
+    per_category, overall = compute_percentages(rows)
+    assert per_category == {"a": 50.0, "b": 100.0, "c": 0.0, "unknown": 100.0}
+    assert overall == pytest.approx(60.0)
+
+
+def test__compute_percentages__no_scores():
+    assert compute_percentages([{"category": "a", "score": None}]) == ({}, 0.0)
+
+
+def test__group_percentages__numba_matches_bincount(monkeypatch):
+    pytest.importorskip("numba")
+    import numpy as np
+
+    import result
+
+    categories = ["a", "b", "a", "c", "b", "a"] * 50
+    scores = np.array([1.0, 0.0, 0.0, 1.0, 1.0, 1.0] * 50)
+    expected = result.group_percentages(categories, scores)
+    monkeypatch.setattr(result, "NUMBA_MIN_ROWS", 0)
+    per_category, overall = result.group_percentages(categories, scores)
+    assert per_category == pytest.approx(expected[0])
+    assert overall == pytest.approx(expected[1])
+
+
+def test__load_judged_rows(tmp_path, result_module):
+    path = tmp_path / "judged.jsonl"
+    path.write_bytes(
+        b'{"example_id": "a", "generation": "g", "score": 1, "explanation": "e", "extra": {"nested": [1, 2]}}\n'
+        b"\n"
+        b'{"id": 7, "response": "r", "score": "n/a", "evaluator_explanation": "ee"}\n'
+        b"{}\n"
+    )
+    a, b, empty = result_module.load_judged_rows(path)
+    assert (a.example_id, a.generation, a.score, a.explanation) == ("a", "g", 1, "e")
+    assert not hasattr(a, "extra")
+    assert (b.id, b.response, b.score, b.evaluator_explanation) == (7, "r", "n/a", "ee")
+    assert b.example_id is None and b.generation is None
+    assert all(getattr(empty, name) is None for name, _, _ in result_module._JUDGED_ROW_FIELDS)
+
+
+def test__main(tmp_path, monkeypatch, capsys, result_module):
+    dataset = tmp_path / "dataset.jsonl"
+    dataset.write_text(
+        '{"example_id": "a", "category": "x", "prompt": "pa", "reference": "ra", "media_url": "http://img/a.png"}\n'
+        '{"example_id": "b", "category": "x", "prompt": "pb", "rubric": "rb", "image": "http://img/b.png"}\n'
+        '{"example_id": "c", "category": "y", "prompt": "pc", "reference": "rc"}\n'
+    )
+    judged = tmp_path / "judged.jsonl"
+    judged.write_text(
+        '{"example_id": "a", "generation": "ga", "score": 1, "explanation": "ea"}\n'
+        '{"id": "b", "response": "gb", "score": "0", "evaluator_explanation": "eb"}\n'
+        "\n"
+        '{"exampleId": "c", "generation": "gc", "score": "n/a"}\n'
+        '{"example_id": "missing", "generation": "gm", "score": 1}\n'
+        '{"generation": "no id", "score": 1}\n'
+    )
+    output = tmp_path / "out" / "results.jsonl"
+    monkeypatch.setattr(sys, "argv", ["result.py", str(judged), "--data", str(dataset), "-o", str(output)])
+    result_module.main()
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert rows == [
+        {
+            "example_id": "a",
+            "category": "x",
+            "prompt": "pa",
+            "reference": "ra",
+            "image": "http://img/a.png",
+            "generation": "ga",
+            "score": 1,
+            "explanation": "ea",
+        },
+        {
+            "example_id": "b",
+            "category": "x",
+            "prompt": "pb",
+            "reference": "rb",
+            "image": "http://img/b.png",
+            "generation": "gb",
+            "score": "0",
+            "explanation": "eb",
+        },
+        {
+            "example_id": "c",
+            "category": "y",
+            "prompt": "pc",
+            "reference": "rc",
+            "image": None,
+            "generation": "gc",
+            "score": "n/a",
+            "explanation": None,
+        },
+    ]
+    # Non-numeric scores are written out but left out of the percentages
+    summary = json.loads((tmp_path / "out" / "results_summary.jsonl").read_text())
+    assert summary == {"x": 50.0, "overall": 50.0}
+    out = capsys.readouterr().out
+    assert "Warning: 1 judged rows had example_ids not found" in out
+    assert "Output 3 examples" in out
+    assert "| x                  |  50.00       |" in out
@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+import pytest
+
+from models import utils
+from models.utils import AsyncRateLimiter, get_first_value, load_dataset_rows
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock; asyncio.sleep advances it instead of waiting."""
+
+    class Clock:
+        now = 1000.0
+        sleeps = []
+
+    async def fake_sleep(seconds):
+        Clock.sleeps.append(seconds)
+        Clock.now += seconds
+
+    Clock.sleeps = []
+    monkeypatch.setattr(utils.time, "monotonic", lambda: Clock.now)
+    monkeypatch.setattr(utils.asyncio, "sleep", fake_sleep)
+    return Clock
+
+
+def test__async_rate_limiter__rpm_burst_then_refill(clock):
+    limiter = AsyncRateLimiter(rpm=60)
+
+    async def run():
+        for _ in range(60):
+            await limiter.acquire()
+        assert clock.sleeps == []
+        # Bucket is empty: the next request waits one refill interval (60 / rpm)
+        await limiter.acquire()
+        assert clock.sleeps == [pytest.approx(1.0)]
+        # Idle time refills the bucket up to, but not beyond, rpm
+        clock.now += 3600
+        for _ in range(60):
+            await limiter.acquire()
+        assert len(clock.sleeps) == 1
+        await limiter.acquire()
+        assert len(clock.sleeps) == 2
+
+    asyncio.run(run())
+
+
+def test__async_rate_limiter__oversized_tokens_clamped_to_tpm(clock):
+    limiter = AsyncRateLimiter(tpm=100)
+
+    async def run():
+        # A request larger than the whole budget is clamped instead of waiting forever
+        await limiter.acquire(tokens=1000)
+        assert clock.sleeps == []
+        await limiter.acquire(tokens=1000)
+        assert clock.sleeps == [pytest.approx(60.0)]
+        await limiter.acquire(tokens=50)
+        assert clock.sleeps[-1] == pytest.approx(30.0)
+
+    asyncio.run(run())
+
+
+def test__async_rate_limiter__unlimited(clock):
+    limiter = AsyncRateLimiter()
+
+    async def run():
+        for _ in range(1000):
+            await limiter.acquire(tokens=10**6)
+
+    asyncio.run(run())
+    assert clock.sleeps == []
+
+
+def test__load_dataset_rows__cache_invalidated_by_older_replacement(tmp_path):
+    dataset = tmp_path / "data.jsonl"
+    dataset.write_text('{"example_id": "a"}\n')
+    assert load_dataset_rows(dataset) == [{"example_id": "a"}]
+    assert (tmp_path / "data.jsonl.idx").exists()
+    assert load_dataset_rows(dataset) == [{"example_id": "a"}]
+
+    # Restoring an older copy leaves its mtime behind the cache's; the rows must still be re-parsed
+    mtime = dataset.stat().st_mtime_ns
+    dataset.write_text('{"example_id": "b"}\n')
+    os.utime(dataset, ns=(mtime - 10**9, mtime - 10**9))
+    assert load_dataset_rows(dataset) == [{"example_id": "b"}]
+    # judge.py passes plain str paths
+    assert load_dataset_rows(str(dataset)) == [{"example_id": "b"}]
+
+
+def test__get_first_value():
+    row = {"id": "", "example_id": "ex", "exampleId": "camel"}
+    assert get_first_value(row, ("id", "example_id", "exampleId")) == "ex"
+    assert get_first_value(row, ("exampleId", "example_id")) == "camel"
+    assert get_first_value({}, ("id",)) is None